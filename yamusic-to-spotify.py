@@ -1,24 +1,112 @@
 import argparse
 import configparser
 import logging
-import spotipy
-from transliterate import translit
-from spotipy import SpotifyOAuth
-from spotipy.exceptions import SpotifyException
-from yandex_music import Client
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+logger = logging.getLogger(__name__)
+
+# spotipy, yandex_music, requests and rapidfuzz are imported where they are used
+# so --help and configuration errors do not pay for loading them
+
+# Russian to Latin transliteration, same rules as transliterate's translit(value, 'ru', reversed=True)
+TRANSLIT_MAPPING = dict(zip('абвгдезийклмнопрстуфхыёэ', 'abvgdezijklmnoprstufhyee'))
+TRANSLIT_MAPPING.update({'ж': 'zh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ю': 'ju', 'я': 'ja', 'ъ': "'", 'ь': "'"})
+TRANSLIT_TABLE = str.maketrans({**TRANSLIT_MAPPING, **{char.upper(): latin.capitalize() for char, latin in TRANSLIT_MAPPING.items()}})
+
+# Patterns used for every searched track, compiled once
+CYRILLIC_RE = re.compile('[\u0400-\u04FF]')
+QUERY_STRIP_RE = re.compile(r'[^\w\s]')  # Punctuation Spotify may read as search operators
+VERSION_SUFFIX_RE = re.compile(r'\s+-\s+.*$|\s*[\(\[][^\)\]]*[\)\]]')  # " - Remastered 2011", " (feat. ...)"
+
+# Maximum number of Spotify searches running at the same time
+MAX_CONCURRENT_SEARCHES = 20
+
+# Maximum number of attempts for a rate limited Spotify request
+SPOTIFY_MAX_ATTEMPTS = 5
+
+# Number of pooled HTTPS connections to Spotify, at least MAX_CONCURRENT_SEARCHES
+HTTP_POOL_SIZE = 32
+
+# Maximum number of playlists fetched and searched at the same time
+MAX_CONCURRENT_PLAYLISTS = 6
+
+# Limits Spotify requests in flight across all playlists
+spotify_semaphore = BoundedSemaphore(MAX_CONCURRENT_SEARCHES)
+
+# Number of Spotify search results ranked for every track
+SEARCH_RESULTS_LIMIT = 10
+
+# Minimum similarity score (0-100) of both the title and the artist to accept a search result without asking
+AUTO_ACCEPT_THRESHOLD = 88
+
+# Table of Spotify search results shown when a song is not found
+FORMAT_TABLE_ROW = "{:<4} {:<50} {:<50} {:<50}".format
+TABLE_HEADER = FORMAT_TABLE_ROW("#", "Song", "Artists", "Album")
+TABLE_DIVIDER = "-" * 154
+
+# Maximum number of tracks fetched from Yandex Music in a single request
+MAX_TRACKS_PER_YANDEX_REQUEST = 100
+
+# Local database with Spotify URIs of already found Yandex Music tracks
+URI_CACHE_PATH = 'uri_map.db'
+URI_CACHE_COMMIT_INTERVAL = 50
+
+class UriCache:
+    # Thread-safe persistent mapping of Yandex Music track ids to Spotify URIs
+    def __init__(self, path, refresh=False):
+        self.refresh = refresh  # Ignore stored URIs but keep saving new ones
+        self.lock = Lock()
+        self.pending = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS map(key TEXT PRIMARY KEY, uri TEXT)')
+
+    def get(self, key):
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.connection.execute('SELECT uri FROM map WHERE key=?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, uri):
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO map VALUES(?, ?)', (key, uri))
+            self.pending += 1
+            if self.pending >= URI_CACHE_COMMIT_INTERVAL:
+                self.connection.commit()
+                self.pending = 0
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
 
 def initialize_yandex_client(user, config):
+    from yandex_music import Client
+
     try:
         access_token = config[user]['yandex_access_token']
         return Client(access_token).init()
     except Exception as e:
-        logging.error(f'Error initializing Yandex Music client for user {user}: {e}')
+        logger.error('Error initializing Yandex Music client for user %s: %s', user, e)
         return None
 
 def initialize_spotify_client(user, config):
+    import requests
+    import spotipy
+    from requests.adapters import HTTPAdapter
+    from spotipy import SpotifyOAuth
+    from urllib3.util.retry import Retry
+
     try:
         client_id = config[user]['spotify_client_id']
         client_secret = config[user]['spotify_client_secret']
@@ -28,14 +116,310 @@ def initialize_spotify_client(user, config):
                                     redirect_uri=redirect_uri,
                                     scope='playlist-modify-private',
                                     cache_path='.cache')
-        return spotipy.Spotify(auth_manager=auth_manager) 
+
+        # Searches share the token cached in .cache, serialize access to it so one thread does not
+        # read the file while another is refreshing the token and fall back to the interactive login
+        token_lock = Lock()
+        get_access_token = auth_manager.get_access_token
+
+        def get_access_token_locked(*args, **kwargs):
+            with token_lock:
+                return get_access_token(*args, **kwargs)
+
+        auth_manager.get_access_token = get_access_token_locked
+
+        # Keep enough pooled connections for all concurrent searches so they are reused
+        # instead of being reopened, and retry transient server errors. Rate limiting (429)
+        # is left to spotify_call, which sees the real Retry-After header. Read timeouts are
+        # not retried so a POST that reached Spotify does not add the same tracks twice
+        retry = Retry(total=5,
+                      read=False,
+                      backoff_factor=0.3,
+                      status_forcelist=[500, 502, 503, 504],
+                      allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']))
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry))
+        return spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
     except Exception as e:
-        logging.error(f'Error initializing Spotify client for user {user}: {e}')
+        logger.error('Error initializing Spotify client for user %s: %s', user, e)
         return None
 
-def transfer_playlists(user, yandex_client, spotify_client, list_only=False, select=False, liked=False):
+def chunks(items, size):
+    # Yield consecutive slices of at most size items
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+def translit_to_latin(value):
+    return value.translate(TRANSLIT_TABLE)
+
+def clean_query(value):
+    # Replace punctuation with spaces, keep the original value if nothing else is left
+    cleaned = ' '.join(QUERY_STRIP_RE.sub(' ', value).split())
+    return cleaned or value
+
+def fetch_tracks(yandex_client, playlist_tracks):
+    # Yield full tracks in playlist order one batch at a time, so the caller can start working on
+    # a batch while the next one is fetched. Playlists usually come with full track info, only the
+    # missing tracks are requested, and each of them only once
+    fetched_tracks = {}
+    for chunked_playlist_tracks in chunks(playlist_tracks, MAX_TRACKS_PER_YANDEX_REQUEST):
+        missing_ids = list(dict.fromkeys(track.track_id for track in chunked_playlist_tracks
+                                         if track.track is None and str(track.id) not in fetched_tracks))
+        if missing_ids:
+            for track in yandex_client.tracks(missing_ids):
+                fetched_tracks[str(track.id)] = track
+
+        for track in chunked_playlist_tracks:
+            full_track = track.track or fetched_tracks.get(str(track.id))
+            if full_track is None:
+                logger.warning('Track %s is not available on Yandex Music', track.track_id)
+                continue
+            yield full_track
+
+def spotify_call(func, *args, **kwargs):
+    from spotipy.exceptions import SpotifyException
+
+    # Retry rate limited requests after the delay requested by Spotify, give up after
+    # SPOTIFY_MAX_ATTEMPTS attempts or when Spotify does not say how long to wait
+    for attempt in range(1, SPOTIFY_MAX_ATTEMPTS + 1):
+        try:
+            with spotify_semaphore:
+                return func(*args, **kwargs)
+        except SpotifyException as e:
+            retry_after = (e.headers or {}).get('Retry-After')
+            if e.http_status != 429 or not retry_after or attempt == SPOTIFY_MAX_ATTEMPTS:
+                raise
+            logger.warning('Spotify rate limit reached, retrying in %s seconds', retry_after)
+            time.sleep(int(retry_after))
+
+def title_score(title, candidate):
+    # Similarity of two titles ignoring case, punctuation and version suffixes like " - Remastered 2011"
+    from rapidfuzz import fuzz, utils
+
+    return max(fuzz.ratio(title, candidate, processor=utils.default_process),
+               fuzz.ratio(VERSION_SUFFIX_RE.sub('', title), VERSION_SUFFIX_RE.sub('', candidate), processor=utils.default_process))
+
+def best_match(track_name, artist_name, items, threshold=AUTO_ACCEPT_THRESHOLD):
+    # Pick the search result whose title and artist are both closest to the track, also comparing
+    # the transliterated names. None if none of them is close enough
+    from rapidfuzz import fuzz, utils
+
+    track_names = {track_name, translit_to_latin(track_name)}
+    artist_names = {artist_name, translit_to_latin(artist_name)}
+
+    best_uri = None
+    best_score = threshold
+    for item in items:
+        track_score = max(title_score(name, item['name']) for name in track_names)
+        artist_score = max((fuzz.WRatio(name, artist['name'], processor=utils.default_process)
+                            for name in artist_names for artist in item['artists']), default=0)
+        score = min(track_score, artist_score)
+        if score >= best_score and (best_uri is None or score > best_score):
+            best_uri = item['uri']
+            best_score = score
+
+    return best_uri
+
+def search_track(user, spotify_client, track, uri_cache=None, search_cache=None, auto_accept_threshold=AUTO_ACCEPT_THRESHOLD,
+                 non_interactive=False):
+    from spotipy.exceptions import SpotifyException
+
+    track_name = ''
+    artist_name = ''
+    track_uri = None
+    try:
+        track_id = str(track.id)
+        track_name = track.title
+        artist_name = track.artists[0].name
+
+        # Reuse the URI found for this track during a previous run
+        if uri_cache:
+            track_uri = uri_cache.get(track_id)
+            if track_uri:
+                return track_id, track_name, artist_name, track_uri
+
+        # Reuse the result of the same search made earlier in this transfer. Tracks with an ISRC
+        # are keyed by it, so different recordings with the same title and artist are not mixed up
+        search_key = ('isrc', track.isrc) if track.isrc else (track_name.lower(), artist_name.lower())
+        if search_cache is not None and search_key in search_cache:
+            track_uri = search_cache[search_key]
+            if track_uri and uri_cache:
+                uri_cache.set(track_id, track_uri)
+            return track_id, track_name, artist_name, track_uri
+
+        # Tracks with an ISRC can be matched exactly
+        if track.isrc:
+            search_result = spotify_call(spotify_client.search, f'isrc:{track.isrc}', type='track', limit=1)
+            if search_result['tracks']['items']:
+                track_uri = search_result['tracks']['items'][0]['uri']
+
+        # Search for the track on Spotify without transliteration and pick the closest result
+        if not track_uri:
+            search_result = spotify_call(spotify_client.search, f'{clean_query(track_name)} artist:{clean_query(artist_name)}', type='track', limit=SEARCH_RESULTS_LIMIT)
+            track_uri = best_match(track_name, artist_name, search_result['tracks']['items'], auto_accept_threshold)
+
+        # If nothing close enough found, perform transliteration and search again
+        # (only Cyrillic names change when transliterated)
+        if not track_uri and CYRILLIC_RE.search(artist_name):
+            # Transliterate the artist name to match Spotify's representation
+            artist_name_transliterated = translit_to_latin(artist_name)
+            search_result = spotify_call(spotify_client.search, f'{clean_query(track_name)} artist:{clean_query(artist_name_transliterated)}', type='track', limit=SEARCH_RESULTS_LIMIT)
+            track_uri = best_match(track_name, artist_name, search_result['tracks']['items'], auto_accept_threshold)
+
+        # Without prompts, pick the closest result of a search by the song name only
+        if not track_uri and non_interactive:
+            search_result = spotify_call(spotify_client.search, clean_query(track_name), type='track', limit=SEARCH_RESULTS_LIMIT)
+            track_uri = best_match(track_name, artist_name, search_result['tracks']['items'], auto_accept_threshold)
+    except SpotifyException as e:
+        logger.error('Error searching for track "%s" by "%s" on Spotify for user %s: %s', track_name, artist_name, user, e)
+        return None
+    except Exception as e:
+        logger.error('Error processing track "%s" by "%s" for user %s: %s', track_name, artist_name, user, e)
+        return None
+
+    if search_cache is not None:
+        search_cache[search_key] = track_uri
+    if track_uri and uri_cache:
+        uri_cache.set(track_id, track_uri)
+
+    return track_id, track_name, artist_name, track_uri
+
+def process_playlist(user, yandex_client, spotify_client, playlist, liked=False, uri_cache=None, search_cache=None, auto_accept_threshold=AUTO_ACCEPT_THRESHOLD,
+                     non_interactive=False):
+    playlist_name = playlist['title']
+
+    try:
+        playlist_id = playlist['kind']
+        owner_id = playlist['owner']['uid']
+
+        # Fetch tracks for the playlist
+        if liked:
+            playlist_name = "Liked Songs from Yandex"
+            playlist_tracks = yandex_client.users_likes_tracks().tracks
+        else:
+            playlist_tracks = yandex_client.users_playlists(playlist_id, owner_id).tracks
+        tracks = fetch_tracks(yandex_client, playlist_tracks)
+
+        # Search for the tracks concurrently as soon as their batch is fetched, the results keep the playlist order
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SEARCHES) as executor:
+            matches = list(executor.map(lambda track: search_track(user, spotify_client, track, uri_cache, search_cache, auto_accept_threshold, non_interactive), tracks))
+    except Exception as e:
+        logger.error('Error fetching tracks for playlist "%s" for user %s: %s', playlist_name, user, e)
+        return None
+
+    return playlist_name, matches
+
+def export_playlist(user, spotify_client, spotify_user_id, playlist_name, matches, uri_cache=None, non_interactive=False):
+    from spotipy.exceptions import SpotifyException
+
+    max_tracks_per_request = 100  # Set the desired maximum tracks per request
+
+    try:
+        spotify_playlist = spotify_call(spotify_client.user_playlist_create, spotify_user_id, playlist_name, public=False)
+        spotify_playlist_id = spotify_playlist['id']
+    except SpotifyException as e:
+        logger.error('Error creating Spotify playlist "%s" for user %s: %s', playlist_name, user, e)
+        return []
+
+    track_uris = []
+    not_found_songs = []  # List to keep track of songs not found
+    skip_all_not_found = False
+
+    for match in matches:
+        if match is None:
+            continue
+
+        track_id, track_name, artist_name, track_uri = match
+        if track_uri:
+            track_uris.append(track_uri)
+        elif non_interactive:
+            # search_track already tried the song name only search, log it without asking
+            not_found_songs.append((track_name, artist_name))
+        elif not skip_all_not_found:
+            # Perform a new search based only on the original song name
+            search_result = spotify_call(spotify_client.search, clean_query(track_name), type='track', limit=5)
+
+            # # Display a numbered list of songs found
+            # print()
+            # print(f'Songs found on Spotify for "{track_name}" by "{artist_name}":')
+            # print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
+            # print("{:<4} {:<50} {:<50} {:<50}".format("#", "Song", "Artists", "Album"))
+            # print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
+            # for i, item in enumerate(search_result['tracks']['items']):
+            #     song_info = "{:<4} {:<50} {:<50} {:<50}".format(i + 1, item["name"], ", ".join([artist["name"] for artist in item["artists"]]), item["album"]["name"])
+            #     print(song_info)
+            # print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
+            # print()  # Print an empty line after the table
+
+            # # Prompt the user to choose a song from the list
+            # while True:
+            #     choice = input('Choose a song to add (enter the number, 0 to skip): ')
+            #     if choice.isdigit() and 0 <= int(choice) <= len(search_result['tracks']['items']):
+            #         break
+
+            # # Add the chosen song to the playlist if a valid choice was made
+            # if choice != '0':
+            #     chosen_track = search_result['tracks']['items'][int(choice) - 1]
+            #     track_uri = chosen_track['uri']
+            #     track_uris.append(track_uri)
+            # else:
+            #     logger.warning('Song not found on Spotify: "%s" by "%s"', track_name, artist_name)
+
+            while True:
+                if search_result['tracks']['items']:
+                    # Print an empty line and the whole table with a single write
+                    rows = ['', f'Songs found on Spotify for "{track_name}" by "{artist_name}":', TABLE_DIVIDER, TABLE_HEADER, TABLE_DIVIDER]
+                    rows.extend(FORMAT_TABLE_ROW(i + 1, item["name"], ", ".join([artist["name"] for artist in item["artists"]]), item["album"]["name"])
+                                for i, item in enumerate(search_result['tracks']['items']))
+                    rows.append(TABLE_DIVIDER)
+                    sys.stdout.write("\n".join(rows) + "\n")
+                else:
+                    print(f'No songs found on Spotify for "{track_name}" by "{artist_name}"')
+
+                choice = input('Choose a song to add (enter the number, 0 to skip, N for next results, S to skip all): ')
+                if choice.isdigit() and 0 < int(choice) <= len(search_result['tracks']['items']):
+                    track_uri = search_result['tracks']['items'][int(choice) - 1]['uri']
+                    track_uris.append(track_uri)
+                    # Remember the pick so the song is not asked about again in the next runs
+                    if uri_cache:
+                        uri_cache.set(track_id, track_uri)
+                    break
+                elif choice == '0':
+                    not_found_songs.append((track_name, artist_name))  # Add the not found song to the list
+                    break
+                elif choice.lower() == 'n':
+                    if 'next' in search_result['tracks']:
+                        search_result = spotify_call(spotify_client.next, search_result['tracks'])
+                    else:
+                        print("No more results available.")
+                elif choice.lower() == 's':
+                    skip_all_not_found = True
+                    not_found_songs.append((track_name, artist_name))
+                    break
+                else:
+                    print("Invalid choice")
+            
+        else:
+            not_found_songs.append((track_name, artist_name))
+
+    # Upload every track once even if it was matched several times
+    track_uris = list(dict.fromkeys(track_uris))
+
+    # Chunk the track URIs into smaller lists to avoid 413 HTTP error
+    for chunked_track_uri in chunks(track_uris, max_tracks_per_request):
+        try:
+            spotify_call(spotify_client.playlist_add_items, spotify_playlist_id, chunked_track_uri)
+        except SpotifyException as e:
+            logger.error('Error adding tracks to Spotify playlist "%s" for user %s: %s', playlist_name, user, e)
+
+    return not_found_songs
+
+def transfer_playlists(user, yandex_client, spotify_client, list_only=False, select=False, liked=False, uri_cache=None,
+                       non_interactive=False, auto_accept_threshold=AUTO_ACCEPT_THRESHOLD):
+    from spotipy.exceptions import SpotifyException
+
     if not yandex_client or not spotify_client:
-        logging.error(f'Yandex Music or Spotify client is not initialized for user {user}')
+        logger.error('Yandex Music or Spotify client is not initialized for user %s', user)
         return
 
     try:
@@ -44,11 +428,11 @@ def transfer_playlists(user, yandex_client, spotify_client, list_only=False, sel
         else:
             yandex_playlists = yandex_client.users_playlists_list()
     except Exception as e:
-        logging.error(f'Error fetching Yandex Music playlists for user {user}: {e}')
+        logger.error('Error fetching Yandex Music playlists for user %s: %s', user, e)
         return
     
     # Logging for testing in case Yandex will return empty list
-    #logging.info(f'Yandex Music playlists for user {user}: {yandex_playlists}')
+    #logger.info('Yandex Music playlists for user %s: %s', user, yandex_playlists)
 
     if list_only:
         print(f'Playlists for user {user}:')
@@ -63,156 +447,60 @@ def transfer_playlists(user, yandex_client, spotify_client, list_only=False, sel
         selected_indices = list(map(int, input().split(',')))
         yandex_playlists = [yandex_playlists[i - 1] for i in selected_indices]
 
-    max_tracks_per_request = 100  # Set the desired maximum tracks per request
-
-    for playlist in yandex_playlists:
-        playlist_name = playlist['title']
-
-        try:
-            playlist_id = playlist['kind']
-            owner_id = playlist['owner']['uid']
-
-            # Fetch tracks for the playlist
-            if liked:
-                playlist_name = "Liked Songs from Yandex"
-                #playlist_tracks = yandex_client.users_likes_tracks().tracks
-                tracks = yandex_client.users_likes_tracks().fetch_tracks()
-            else:
-                playlist_tracks = yandex_client.users_playlists(playlist_id, owner_id).tracks
-                tracks = []
-                for track in playlist_tracks:
-                    tracks.append(track.track)
-
-            playlist_info = {'title': playlist_name, 'tracks': tracks}
-        except Exception as e:
-            logging.error(f'Error fetching tracks for playlist "{playlist_name}" for user {user}: {e}')
-            continue
-
-        try:
-            spotify_playlist = spotify_client.user_playlist_create(spotify_client.me()['id'], playlist_name, public=False)
-            spotify_playlist_id = spotify_playlist['id']
-        except SpotifyException as e:
-            logging.error(f'Error creating Spotify playlist "{playlist_name}" for user {user}: {e}')
-            continue
+    # Fetch the Spotify user id once, this also completes the authorization
+    # before worker threads start using the client
+    try:
+        spotify_user_id = spotify_call(spotify_client.me)['id']
+    except SpotifyException as e:
+        logger.error('Error fetching Spotify profile for user %s: %s', user, e)
+        return
 
-        track_uris = []
-        not_found_songs = []  # List to keep track of songs not found
-        skip_all_not_found = False
+    all_not_found_songs = []  # Songs not found in any of the exported playlists
+    search_cache = {}  # Spotify URIs by (track name, artist name) shared by all playlists
 
-        for track_short in playlist_info['tracks']:
-            track_name = ''
-            artist_name = ''
+    try:
+        # Fetch and search playlists in parallel, then export them one by one in the selected order
+        # so the interactive prompts of different playlists never interleave
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PLAYLISTS) as executor:
+            futures = [executor.submit(process_playlist, user, yandex_client, spotify_client, playlist, liked, uri_cache, search_cache, auto_accept_threshold, non_interactive) for playlist in yandex_playlists]
             try:
-                track_name = track_short.title
-                artist_name = track_short.artists[0].name
-
-                # Search for the track on Spotify without transliteration
-                search_result = spotify_client.search(f'{track_name} artist:{artist_name}', type='track', limit=1)
-
-                # If no results found, perform transliteration and search again
-                if not search_result['tracks']['items']:
-                    # Transliterate the artist name to match Spotify's representation
-                    artist_name_transliterated = translit(artist_name, 'ru', reversed=True)
-                    search_result = spotify_client.search(f'{track_name} artist:{artist_name_transliterated}', type='track', limit=1)
-            except SpotifyException as e:
-                logging.error(f'Error searching for track "{track_name}" by "{artist_name}" on Spotify for user {user}: {e}')
-                continue
-            except Exception as e:
-                logging.error(f'Error processing track "{track_name}" by "{artist_name}" for user {user}: {e}')
-                continue
+                for future in futures:
+                    processed_playlist = future.result()
+                    if processed_playlist:
+                        all_not_found_songs.extend(export_playlist(user, spotify_client, spotify_user_id, *processed_playlist, uri_cache, non_interactive))
+            except BaseException:
+                # Do not wait for the queued playlists on Ctrl+C or an error
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
 
-            if search_result['tracks']['items']:
-                track_uri = search_result['tracks']['items'][0]['uri']
-                track_uris.append(track_uri)
-            elif not skip_all_not_found:
-                # Perform a new search based only on the original song name
-                search_result = spotify_client.search(track_name, type='track', limit=5)
-
-                # # Display a numbered list of songs found
-                # print()
-                # print(f'Songs found on Spotify for "{track_name}" by "{artist_name}":')
-                # print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
-                # print("{:<4} {:<50} {:<50} {:<50}".format("#", "Song", "Artists", "Album"))
-                # print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
-                # for i, item in enumerate(search_result['tracks']['items']):
-                #     song_info = "{:<4} {:<50} {:<50} {:<50}".format(i + 1, item["name"], ", ".join([artist["name"] for artist in item["artists"]]), item["album"]["name"])
-                #     print(song_info)
-                # print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
-                # print()  # Print an empty line after the table
-
-                # # Prompt the user to choose a song from the list
-                # while True:
-                #     choice = input('Choose a song to add (enter the number, 0 to skip): ')
-                #     if choice.isdigit() and 0 <= int(choice) <= len(search_result['tracks']['items']):
-                #         break
-
-                # # Add the chosen song to the playlist if a valid choice was made
-                # if choice != '0':
-                #     chosen_track = search_result['tracks']['items'][int(choice) - 1]
-                #     track_uri = chosen_track['uri']
-                #     track_uris.append(track_uri)
-                # else:
-                #     logging.warning(f'Song not found on Spotify: "{track_name}" by "{artist_name}"')
-
-                while True:
-                    if search_result['tracks']['items']:
-                        print()  # Print an empty line after the table
-                        print(f'Songs found on Spotify for "{track_name}" by "{artist_name}":')
-                        print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
-                        print("{:<4} {:<50} {:<50} {:<50}".format("#", "Song", "Artists", "Album"))
-                        print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
-                        for i, item in enumerate(search_result['tracks']['items']):
-                            song_info = "{:<4} {:<50} {:<50} {:<50}".format(i + 1, item["name"], ", ".join([artist["name"] for artist in item["artists"]]), item["album"]["name"])
-                            print(song_info)
-                        print("----------------------------------------------------------------------------------------------------------------------------------------------------------")
-                    else:
-                        print(f'No songs found on Spotify for "{track_name}" by "{artist_name}"')
-    
-                    choice = input('Choose a song to add (enter the number, 0 to skip, N for next results, S to skip all): ')
-                    if choice.isdigit() and 0 < int(choice) <= len(search_result['tracks']['items']):
-                        break
-                    elif choice == '0':
-                        not_found_songs.append((track_name, artist_name))  # Add the not found song to the list
-                        break
-                    elif choice.lower() == 'n':
-                        if 'next' in search_result['tracks']:
-                            search_result = spotify_client.next(search_result['tracks'])
-                        else:
-                            print("No more results available.")
-                    elif choice.lower() == 's':
-                        skip_all_not_found = True
-                        not_found_songs.append((track_name, artist_name))
-                        break
-                    else:
-                        print("Invalid choice")
-                
-            else:
-                not_found_songs.append((track_name, artist_name))
- 
         # Create a log file with not found songs
-        if not_found_songs:
+        if all_not_found_songs:
             with open('not_found_songs.log', 'w', encoding='utf-8') as file:
                 file.write("Songs not found on Spotify:\n")
-                for song in not_found_songs:
-                    file.write(f"{song[0]} by {song[1]}\n")
-
-        # Chunk the track URIs into smaller lists to avoid 413 HTTP error
-        chunked_track_uris = [track_uris[i:i+max_tracks_per_request] for i in range(0, len(track_uris), max_tracks_per_request)]
-
-        for chunked_track_uri in chunked_track_uris:
-            try:
-                spotify_client.playlist_add_items(spotify_playlist_id, chunked_track_uri)
-            except SpotifyException as e:
-                logging.error(f'Error adding tracks to Spotify playlist "{playlist_name}" for user {user}: {e}')
+                file.writelines(f"{track_name} by {artist_name}\n" for track_name, artist_name in all_not_found_songs)
+    finally:
+        # Keep the matches found so far even if the transfer was interrupted
+        if uri_cache:
+            uri_cache.commit()
+
+def similarity_score(value):
+    # argparse type for scores in the 0-100 range used by rapidfuzz
+    score = int(value)
+    if not 0 <= score <= 100:
+        raise argparse.ArgumentTypeError(f'{value} is not between 0 and 100')
+    return score
 
 def main():
+    # Configure logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
     # Read configuration
     config = configparser.ConfigParser()
     config.read('config.txt')
 
     # Check if there are any users in the config file
     if len(config.sections()) == 0:
-        logging.error("No users found in the configuration file")
+        logger.error("No users found in the configuration file")
         return
 
     # Parse command-line arguments
@@ -221,6 +509,10 @@ def main():
     parser.add_argument('--list', action='store_true', help='List all playlists')
     parser.add_argument('--select', action='store_true', help='Select playlists to export')
     parser.add_argument('--liked', action='store_true', help='Export liked songs')
+    parser.add_argument('--refresh-cache', action='store_true', help='Search all tracks again instead of using cached Spotify matches')
+    parser.add_argument('--non-interactive', action='store_true', help='Do not ask to choose songs that were not found, log them instead')
+    parser.add_argument('--auto-accept-threshold', type=similarity_score, default=AUTO_ACCEPT_THRESHOLD,
+                        help=f'Minimum similarity score (0-100) to add a found song without asking (default: {AUTO_ACCEPT_THRESHOLD})')
     args = parser.parse_args()
 
     if not args.user:
@@ -229,7 +521,7 @@ def main():
             print(f"{i+1}. {user}")
         user_index = int(input("Choose a user (enter the number): ")) - 1
         if user_index < 0 or user_index >= len(config.sections()):
-            logging.error("Invalid user selection")
+            logger.error("Invalid user selection")
             return
         selected_user = config.sections()[user_index]
     else:
@@ -243,30 +535,41 @@ def main():
 
     if args.list:
         transfer_playlists(selected_user, yandex_client, spotify_client, list_only=True)
-    elif args.select:
-        transfer_playlists(selected_user, yandex_client, spotify_client, select=True)
-    elif args.liked:
-        transfer_playlists(selected_user, yandex_client, spotify_client, liked=True)
-    else:
-        while True:
-            print(f"\nUser: {selected_user}")
-            print("Options:")
-            print("1. List playlists")
-            print("2. Export playlists")
-            print("3. Export liked songs")
-            print("4. Quit")
-            choice = int(input("Choose an option (1-4): "))
-
-            if choice == 1:
-                transfer_playlists(selected_user, yandex_client, spotify_client, list_only=True)
-            elif choice == 2:
-                transfer_playlists(selected_user, yandex_client, spotify_client, select=True)
-            elif choice == 3:
-                transfer_playlists(selected_user, yandex_client, spotify_client, liked=True)
-            elif choice == 4:
-                break
-            else:
-                print("Invalid choice")
+        return
+
+    # The URI cache is only opened when playlists may be exported
+    uri_cache = UriCache(URI_CACHE_PATH, refresh=args.refresh_cache)
+    export_options = {'uri_cache': uri_cache,
+                      'non_interactive': args.non_interactive,
+                      'auto_accept_threshold': args.auto_accept_threshold}
+
+    try:
+        if args.select:
+            transfer_playlists(selected_user, yandex_client, spotify_client, select=True, **export_options)
+        elif args.liked:
+            transfer_playlists(selected_user, yandex_client, spotify_client, liked=True, **export_options)
+        else:
+            while True:
+                print(f"\nUser: {selected_user}")
+                print("Options:")
+                print("1. List playlists")
+                print("2. Export playlists")
+                print("3. Export liked songs")
+                print("4. Quit")
+                choice = int(input("Choose an option (1-4): "))
+
+                if choice == 1:
+                    transfer_playlists(selected_user, yandex_client, spotify_client, list_only=True)
+                elif choice == 2:
+                    transfer_playlists(selected_user, yandex_client, spotify_client, select=True, **export_options)
+                elif choice == 3:
+                    transfer_playlists(selected_user, yandex_client, spotify_client, liked=True, **export_options)
+                elif choice == 4:
+                    break
+                else:
+                    print("Invalid choice")
+    finally:
+        uri_cache.close()
 
 if __name__ == '__main__':
     main()